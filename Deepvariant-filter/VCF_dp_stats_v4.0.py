@@ -1,62 +1,234 @@
 #!/usr/bin/env python3
 import sys
+import os
 import gzip
+import mmap
+import shutil
+import tempfile
+import subprocess
+import contextlib
 import numpy as np
 
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """未安装 numba 时退化为普通 Python 函数"""
+        return lambda func: func
+
 if len(sys.argv) != 2:
     sys.stderr.write(f"Usage: {sys.argv[0]} <input.vcf.gz>\n")
     sys.exit(1)
 
 vcf_file = sys.argv[1]
-dp_values = []
 
 def open_vcf(path):
+    # 以二进制方式读取，省去逐行 UTF-8 解码
     if path.endswith(".gz"):
-        return gzip.open(path, "rt")
+        return gzip.open(path, "rb")
     else:
-        return open(path, "r")
+        return open(path, "rb")
 
-# --- 读取 VCF ---
-print(f"Reading VCF file: {vcf_file} ...", file=sys.stderr)
-with open_vcf(vcf_file) as f:
-    for line in f:
-        if line.startswith("#"):
-            continue
+# 预分配 int32 缓冲区，满了就倍增，避免 Python list 的装箱与反复扩容
+INIT_BUF_SIZE = 1 << 20
 
-        fields = line.rstrip().split("\t")
-        if len(fields) < 10:
-            continue
+def grow(buf):
+    return np.resize(buf, buf.size * 2)
 
-        fmt = fields[8].split(":")
-        sample = fields[9].split(":")
+def read_dp_text(path):
+    """纯 Python 逐行解析 (未安装 numba 时使用)"""
+    buf = np.empty(INIT_BUF_SIZE, dtype=np.int32)
+    n = 0
+    with open_vcf(path) as f:
+        for line in f:
+            if line.startswith(b"#"):
+                continue
 
-        if "DP" not in fmt:
-            continue
+            # 只需要 FORMAT (第9列) 与第一个样本 (第10列)：限制切分次数，
+            # 不再对整行 rstrip，只清理样本列末尾的换行
+            fields = line.split(b"\t", 10)
+            if len(fields) < 10:
+                continue
 
-        try:
-            dp_idx = fmt.index("DP")
+            fmt = fields[8].split(b":")
+            if b"DP" not in fmt:
+                continue
+
+            sample = fields[9].rstrip().split(b":")
+
+            dp_idx = fmt.index(b"DP")
+            if dp_idx >= len(sample):
+                continue
+            # 缺失值 "." 与非法值都不是纯数字，直接跳过，无需异常处理
             dp_str = sample[dp_idx]
-            if dp_str == ".":
+            if not dp_str.isdigit():
                 continue
-            dp = int(dp_str)
-            dp_values.append(dp)
-        except (ValueError, IndexError):
-            continue
+            if n == buf.size:
+                buf = grow(buf)
+            buf[n] = int(dp_str)
+            n += 1
+    return buf[:n]
+
+# ==== 字节扫描公共部分 (BEGIN) ====
+# 本段与 SV_depth_stats_v6.0.py 中的同名段落逐字一致：两个统计脚本各自独立运行、
+# 不共享模块，修改时需同步两处
+PIGZ = shutil.which("pigz")
+
+@contextlib.contextmanager
+def mapped_vcf(path):
+    """
+    以只读 mmap 映射 (解压后的) VCF 全文。普通文件直接映射；
+    .gz 先用 pigz (未安装时用 gzip 模块) 解压到匿名临时文件再映射。
+    """
+    with contextlib.ExitStack() as stack:
+        if path.endswith(".gz"):
+            f = stack.enter_context(tempfile.TemporaryFile())
+            if PIGZ:
+                ret = subprocess.run([PIGZ, "-dc", path], stdout=f).returncode
+                if ret != 0:
+                    sys.stderr.write(f"Error: pigz failed to decompress {path} (exit code {ret}).\n")
+                    sys.exit(1)
+            else:
+                with gzip.open(path, "rb") as gz:
+                    shutil.copyfileobj(gz, f, 1 << 20)
+            f.flush()
+        else:
+            f = stack.enter_context(open(path, "rb"))
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+@njit(cache=True)
+def format_sample_span(data, start, end):
+    """
+    行 [start, end) 中第 9 列 (FORMAT) 与第 10 列 (第一个样本，去掉末尾空白) 的起止下标；
+    列数不足时全部返回 -1
+    """
+    col = 0
+    col_start = start
+    fmt_s = -1
+    fmt_e = -1
+    for i in range(start, end + 1):
+        if i == end or data[i] == 9:
+            if col == 8:
+                fmt_s = col_start
+                fmt_e = i
+            elif col == 9:
+                smp_e = i
+                while smp_e > col_start and (data[smp_e - 1] == 32 or 9 <= data[smp_e - 1] <= 13):
+                    smp_e -= 1
+                return fmt_s, fmt_e, col_start, smp_e
+            col += 1
+            col_start = i + 1
+    return -1, -1, -1, -1
 
-if len(dp_values) == 0:
+@njit(cache=True)
+def int_field(data, start, end, k):
+    """样本列 [start, end) 中第 k 个冒号分隔字段的非负整数值；缺失 "."、越界或非纯数字返回 -1"""
+    j = 0
+    tok = start
+    for i in range(start, end + 1):
+        if i == end or data[i] == 58:
+            if j == k:
+                if i == tok:
+                    return -1
+                val = 0
+                for t in range(tok, i):
+                    d = np.int64(data[t]) - 48
+                    if d < 0 or d > 9:
+                        return -1
+                    val = val * 10 + d
+                return val
+            j += 1
+            tok = i + 1
+    return -1
+
+@njit(cache=True)
+def count_lines(data):
+    n = 1
+    for i in range(data.size):
+        if data[i] == 10:
+            n += 1
+    return n
+
+# ==== 字节扫描公共部分 (END) ====
+
+@njit(cache=True)
+def extract_dp(data):
+    """
+    逐字节扫描整个 VCF：跳过 "#" 行，定位 FORMAT 与第一个样本列，
+    找到 DP 在 FORMAT 中的序号后直接解析样本中对应的整数，结果写入预分配的 int32 数组
+    """
+    out = np.empty(count_lines(data), dtype=np.int32)
+    n = 0
+    start = 0
+    size = data.size
+    while start < size:
+        end = start
+        while end < size and data[end] != 10:
+            end += 1
+        if data[start] != 35:
+            fmt_s, fmt_e, smp_s, smp_e = format_sample_span(data, start, end)
+            if fmt_s >= 0:
+                # 在 FORMAT 中查找第一个恰为 "DP" 的字段
+                k = -1
+                j = 0
+                tok = fmt_s
+                for i in range(fmt_s, fmt_e + 1):
+                    if i == fmt_e or data[i] == 58:
+                        if i - tok == 2 and data[tok] == 68 and data[tok + 1] == 80:
+                            k = j
+                            break
+                        j += 1
+                        tok = i + 1
+                if k >= 0:
+                    val = int_field(data, smp_s, smp_e, k)
+                    if val >= 0:
+                        out[n] = val
+                        n += 1
+        start = end + 1
+    return out[:n]
+
+def read_dp_numba(path):
+    """numba 编译的字节扫描解析，不为每条记录创建 Python 对象"""
+    with mapped_vcf(path) as mm:
+        return extract_dp(np.frombuffer(mm, dtype=np.uint8))
+
+# --- 读取 VCF ---
+print(f"Reading VCF file: {vcf_file} ...", file=sys.stderr)
+if HAVE_NUMBA:
+    dp = read_dp_numba(vcf_file)
+else:
+    dp = read_dp_text(vcf_file)
+
+if dp.size == 0:
     sys.stderr.write("No DP values found in VCF.\n")
     sys.exit(1)
 
-dp = np.array(dp_values)
-
 # --- 统计基础信息 ---
-median_dp = np.median(dp)
+# 只排序一次，之后的最值 / 中位数 / 分位数都是 O(1) 下标读取
+dp.sort()
+
+def sorted_quantile(sorted_dp, qs):
+    """在已排序数组上按线性插值取分位数 (与 np.quantile 默认 method='linear' 一致)"""
+    pos = np.asarray(qs, dtype=np.float64) * (sorted_dp.size - 1)
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo + 1, sorted_dp.size - 1)
+    low_val = sorted_dp[lo].astype(np.float64)
+    return low_val + (sorted_dp[hi] - low_val) * (pos - lo)
+
+median_dp = sorted_quantile(dp, 0.5)
 mean_dp = np.mean(dp)
-max_dp_actual = np.max(dp)
+max_dp_actual = dp[-1]
 
 print("\n==== DP Statistics ====")
 print(f"Total variants : {dp.size}")
-print(f"Min DP         : {dp.min()}")
+print(f"Min DP         : {dp[0]}")
 print(f"Mean DP        : {mean_dp:.2f}")
 print(f"Max DP         : {max_dp_actual}")
 
@@ -75,8 +247,9 @@ quantiles_dict = {
 }
 
 print("\n---- Quantiles Distribution ----")
-for name, q in quantiles_dict.items():
-    print(f"{name:12s}: {np.quantile(dp, q):.2f}")
+quantile_vals = sorted_quantile(dp, list(quantiles_dict.values()))
+for name, val in zip(quantiles_dict, quantile_vals):
+    print(f"{name:12s}: {val:.2f}")
 
 # --- 阈值计算 (严格模式: 0.5x - 2.0x) ---
 min_dp_strict = int(median_dp * 0.5)
@@ -97,35 +270,45 @@ print("-" * 40)
 # --- ASCII 直方图 ---
 print(f"\n==== DP Histogram (Cutoff Preview: {min_dp_strict}-{max_dp_strict}) ====")
 # 智能调整直方图范围：如果有极长尾，只显示到 P99 或 max_dp_strict 的 1.5 倍，避免图被拉得太扁
-p99 = np.quantile(dp, 0.99)
+p99 = sorted_quantile(dp, 0.99)
 display_max = max(max_dp_strict * 1.5, p99) 
 # 如果最大值实在太大，强制截断以便观察主峰
 if display_max > median_dp * 5:
     display_max = median_dp * 5
 
-hist, bin_edges = np.histogram(dp, bins=60, range=(0, display_max))
+# DP 是非负整数：先 bincount 得到每个深度值的计数 (单遍 O(N))，
+# 再把这些不同深度值 (最多 display_max+1 个) 映射到 60 个区间
+n_bins = 60
+lo_edge, hi_edge = 0.0, float(display_max)
+if lo_edge == hi_edge:
+    # 与 np.histogram 对退化区间的处理一致
+    lo_edge, hi_edge = lo_edge - 0.5, hi_edge + 0.5
+bin_edges = np.linspace(lo_edge, hi_edge, n_bins + 1)
+# dp 已排序，区间内的值是一段连续切片
+in_range = dp[np.searchsorted(dp, lo_edge, side="left"):np.searchsorted(dp, hi_edge, side="right")]
+value_counts = np.bincount(in_range) if in_range.size else np.zeros(0, dtype=np.intp)
+value_bins = np.searchsorted(bin_edges, np.arange(value_counts.size), side="right") - 1
+# 最后一个区间为闭区间 (== display_max 的值落在最后一格)
+np.clip(value_bins, 0, n_bins - 1, out=value_bins)
+hist = np.bincount(value_bins, weights=value_counts, minlength=n_bins).astype(np.int64)
 max_hist = max(hist)
 scale = 50 / max_hist if max_hist > 0 else 1
 
-for i in range(len(hist)):
-    bar_len = int(hist[i] * scale)
-    bar = "*" * bar_len
-    low_edge = int(bin_edges[i])
-    high_edge = int(bin_edges[i+1])
-    
-    # 标记位置
-    mark = ""
-    # 标记 Median
-    if low_edge <= median_dp < high_edge:
-        mark += " <--- Median"
-    
-    # 标记 阈值边界
-    if low_edge <= min_dp_strict < high_edge:
-        mark += " [Min Cutoff]"
-    if low_edge <= max_dp_strict < high_edge:
-        mark += " [Max Cutoff]"
-        
-    print(f"{low_edge:3d}-{high_edge:3d} | {bar}{mark}")
+# 预先定位 Median / 阈值边界所在的区间 (按取整后的区间边界 [low, high) 判断)，
+# 打印循环中只需查表
+edge_ints = bin_edges.astype(np.int64)
+marker_values = np.array([median_dp, min_dp_strict, max_dp_strict], dtype=np.float64)
+marker_bins = np.searchsorted(edge_ints, marker_values, side="right") - 1
+markers = {}
+for label, b in zip((" <--- Median", " [Min Cutoff]", " [Max Cutoff]"), marker_bins):
+    if 0 <= b < n_bins:
+        markers[int(b)] = markers.get(int(b), "") + label
+
+# 区间边界取整与柱长计算一次性向量化完成，循环中只负责拼接输出
+bar_lens = (hist * scale).astype(np.int64).tolist()
+edge_list = edge_ints.tolist()
+for i in range(n_bins):
+    print(f"{edge_list[i]:3d}-{edge_list[i+1]:3d} | {'*' * bar_lens[i]}{markers.get(i, '')}")
 
 print("\n==== Example bcftools command ====")
 print(f"bcftools filter -i 'FORMAT/DP>={min_dp_strict} && FORMAT/DP<={max_dp_strict}' \\")
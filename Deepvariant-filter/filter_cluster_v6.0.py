@@ -3,7 +3,30 @@ import sys
 import argparse
 import math
 import gzip
+import itertools
 import re
+import array
+import shutil
+import signal
+import subprocess
+import contextlib
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """未安装 numba 时退化为普通 Python 函数"""
+        return lambda func: func
+
+COPY_BLOCK_SIZE = 1 << 20
+
+# ##contig=<ID=xxx,length=123>
+CONTIG_ID_RE = re.compile(r'ID=([^,>]+)')
+CONTIG_LEN_RE = re.compile(r'length=(\d+)')
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -26,11 +49,30 @@ def parse_args():
     
     return parser.parse_args()
 
+PIGZ = shutil.which("pigz")
+
+@contextlib.contextmanager
 def open_vcf(path):
-    if path.endswith(".gz"):
-        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
-    else:
-        return open(path, "r", encoding="utf-8", errors="replace")
+    """
+    以二进制方式打开 VCF (字节偏移与输出都按原始字节处理)；
+    .gz 文件优先交给 pigz 在独立进程中解压，未安装 pigz 时回退到 gzip 模块
+    """
+    if not (path.endswith(".gz") and PIGZ):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            yield f
+        return
+    
+    proc = subprocess.Popen([PIGZ, "-dc", path], stdout=subprocess.PIPE, bufsize=1 << 20)
+    try:
+        with proc.stdout as f:
+            yield f
+    finally:
+        # 提前关闭管道时 pigz 会收到 SIGPIPE 退出，这属于正常情况
+        ret = proc.wait()
+    if ret not in (0, -signal.SIGPIPE):
+        print(f"[ERROR] pigz 解压 {path} 失败 (退出码 {ret})", file=sys.stderr)
+        sys.exit(1)
 
 def get_chrom_lengths_from_fai(fai_path):
     """从fai文件中提取染色体长度"""
@@ -62,65 +104,88 @@ def get_chrom_lengths_from_fai(fai_path):
     
     return chrom_lens
 
-def get_chrom_lengths_from_vcf(vcf_path):
-    """从 VCF Header (##contig) 中提取染色体长度"""
-    chrom_lens = {}
-    print(f"[Pass 1] 正在扫描 VCF Header 获取染色体长度...", file=sys.stderr)
+def scan_vcf(vcf_path, chrom_lens):
+    """
+    第一遍扫描：读取 Header (##contig) 中的染色体长度，并把每条变异按列记录为
+    染色体编号、位置与该行在 (解压后) 文件中的字节偏移，不保留原始行。
+    chrom_lens 为 FAI 中的长度，Header 中的长度仅补充 FAI 中没有的染色体 (FAI 优先)。
+    返回的 offsets 比记录数多一个元素，最后一个为文件末尾偏移。
+    """
+    print(f"[Pass 1] 正在扫描 VCF Header 并读取变异坐标...", file=sys.stderr)
+    chrom_codes = {}
+    chrom_ids = array.array("i")
+    positions = array.array("i")
+    offsets = array.array("q")
+    header_lens = {}
+    offset = 0
+    
     with open_vcf(vcf_path) as f:
+        # Header 在第一条记录之前结束：先在同一个文件流上读完 Header，
+        # 剩余部分全是记录，逐行不再需要判断是否以 "#" 开头
+        first_record = None
         for line in f:
-            if line.startswith("##contig"):
+            if not line.startswith(b"#"):
+                first_record = line
+                break
+            offset += len(line)
+            if line.startswith(b"##contig"):
                 # 解析 ID=xxx,length=123
-                m_id = re.search(r'ID=([^,>]+)', line)
-                m_len = re.search(r'length=(\d+)', line)
+                text = line.decode("utf-8", errors="replace")
+                m_id = CONTIG_ID_RE.search(text)
+                m_len = CONTIG_LEN_RE.search(text)
                 if m_id and m_len:
-                    chrom_lens[m_id.group(1)] = int(m_len.group(1))
-            elif not line.startswith("#"):
-                break # Header 结束
-    return chrom_lens
-
-def get_combined_chrom_lengths(args):
-    """整合FAI和VCF Header中的染色体长度（FAI优先）"""
-    # 1. 优先从FAI文件读取
-    chrom_lens = get_chrom_lengths_from_fai(args.fai)
+                    header_lens[m_id.group(1)] = int(m_len.group(1))
+        header_end = offset
+        
+        records = itertools.chain((first_record,), f) if first_record is not None else ()
+        for line in records:
+            offsets.append(offset)
+            offset += len(line)
+            
+            fields = line.split(b'\t', 2)
+            try:
+                chrom = fields[0]
+                pos = int(fields[1])
+            except (ValueError, IndexError):
+                # 无法解析的行不参与统计与比较，也不输出 (编号记为 -1)
+                chrom_ids.append(-1)
+                positions.append(0)
+                continue
+            
+            code = chrom_codes.get(chrom)
+            if code is None:
+                code = len(chrom_codes)
+                chrom_codes[chrom] = code
+            chrom_ids.append(code)
+            positions.append(pos)
+        offsets.append(offset)
     
-    # 2. 补充VCF Header中的长度（仅补充FAI中没有的）
-    vcf_chrom_lens = get_chrom_lengths_from_vcf(args.input_vcf)
-    for chrom, length in vcf_chrom_lens.items():
+    # 补充VCF Header中的长度（仅补充FAI中没有的）
+    for chrom, length in header_lens.items():
         if chrom not in chrom_lens:
             chrom_lens[chrom] = length
     
-    return chrom_lens
+    chrom_codes = {chrom.decode("utf-8", errors="replace"): code
+                   for chrom, code in chrom_codes.items()}
+    return chrom_codes, chrom_ids, positions, offsets, header_end
 
-def calculate_stats(vcf_path, chrom_lens, sdr_chrom):
-    """第一遍扫描：统计各区域变异数"""
-    print(f"[Pass 1] 正在统计变异数量以计算密度...", file=sys.stderr)
-    
-    count_sdr = 0
-    count_other = 0
+def calculate_stats(chrom_codes, chrom_ids, positions, chrom_lens, sdr_chrom):
+    """由坐标数组统计各区域变异数并计算密度"""
+    ids = np.frombuffer(chrom_ids, dtype=np.int32)
+    valid = ids >= 0
+    ids = ids[valid]
+    pos = np.frombuffer(positions, dtype=np.int32)[valid]
     
-    # 如果 Header/FAI 里没找到长度，记录最大位置作为替补
-    max_pos_sdr = 0
-    max_pos_other = 0
-    
-    with open_vcf(vcf_path) as f:
-        for line in f:
-            if line.startswith("#"): continue
-            
-            fields = line.split('\t')
-            if len(fields) < 2: continue
-            
-            chrom = fields[0]
-            try:
-                pos = int(fields[1])
-            except ValueError:
-                continue
-
-            if chrom == sdr_chrom:
-                count_sdr += 1
-                if pos > max_pos_sdr: max_pos_sdr = pos
-            else:
-                count_other += 1
-                if pos > max_pos_other: max_pos_other = pos
+    sdr_code = chrom_codes.get(sdr_chrom)
+    if sdr_code is None:
+        count_sdr = 0
+        max_pos_sdr = 0
+    else:
+        sdr_pos = pos[ids == sdr_code]
+        count_sdr = int(sdr_pos.size)
+        # 如果 Header/FAI 里没找到长度，记录最大位置作为替补
+        max_pos_sdr = int(sdr_pos.max()) if sdr_pos.size else 0
+    count_other = int(ids.size) - count_sdr
     
     # --- 计算 SDR 密度 ---
     len_sdr = chrom_lens.get(sdr_chrom, 0)
@@ -159,10 +224,70 @@ def calculate_dist_threshold(het, p_value, min_threshold):
     # 取计算值和下限值的较大者，保证阈值≥min_threshold
     return max(calc_thresh, min_threshold)
 
+def kept_byte_ranges(offsets, keep, header_end):
+    """把保留记录的字节偏移合并成连续区间 [start, end)，Header 作为第一个区间"""
+    offs = np.frombuffer(offsets, dtype=np.int64)
+    edges = np.diff(np.concatenate(([0], keep.astype(np.int8), [0])))
+    starts = offs[np.flatnonzero(edges == 1)]
+    ends = offs[np.flatnonzero(edges == -1)]
+    ranges = [(0, header_end)] if header_end > 0 else []
+    ranges.extend(zip(starts.tolist(), ends.tolist()))
+    return ranges
+
+def copy_byte_ranges(f, ranges, write):
+    """按顺序写出输入流中的各字节区间；可 seek 的文件直接跳过被删除的部分，否则读过即丢"""
+    seekable = f.seekable()
+    cur = 0
+    for start, end in ranges:
+        if seekable:
+            f.seek(start)
+        else:
+            while cur < start:
+                chunk = f.read(min(start - cur, COPY_BLOCK_SIZE))
+                if not chunk:
+                    return
+                cur += len(chunk)
+        cur = start
+        while cur < end:
+            chunk = f.read(min(end - cur, COPY_BLOCK_SIZE))
+            if not chunk:
+                return
+            write(chunk)
+            cur += len(chunk)
+
+@njit(cache=True)
+def mark_clusters(chrom_ids, positions, thresh_by_chrom):
+    """
+    对坐标排序的变异做连坐判定：与同染色体上距离 <= 阈值的任一变异互相标记为删除。
+    输入已排序时，只需与前一个有效变异比较：更早的变异若与当前变异冲突，
+    它与其后继的距离必然也不超过阈值，已在之前被标记。整体 O(N)。
+    返回 (keep, unsorted)：发现同染色体上位置倒序时立即停止，unsorted 为该记录下标，否则为 -1。
+    """
+    n = len(chrom_ids)
+    keep = np.ones(n, dtype=np.bool_)
+    prev = -1
+    for i in range(n):
+        c = chrom_ids[i]
+        if c < 0:
+            keep[i] = False
+            continue
+        if prev >= 0 and chrom_ids[prev] == c:
+            dist = positions[i] - positions[prev]
+            if dist < 0:
+                # 未排序：只比较前一个变异的结论不再成立
+                return keep, i
+            if dist <= thresh_by_chrom[c]:
+                # 冲突：连坐
+                keep[i] = False
+                keep[prev] = False
+        prev = i
+    return keep, -1
+
 def process_vcf(args):
     # --- 步骤 1: 获取长度与统计密度 ---
-    chrom_lens = get_combined_chrom_lengths(args)
-    het_sdr, het_other = calculate_stats(args.input_vcf, chrom_lens, args.sdr_chrom)
+    chrom_lens = get_chrom_lengths_from_fai(args.fai)
+    chrom_codes, chrom_ids, positions, offsets, header_end = scan_vcf(args.input_vcf, chrom_lens)
+    het_sdr, het_other = calculate_stats(chrom_codes, chrom_ids, positions, chrom_lens, args.sdr_chrom)
     
     # 如果背景杂合度太低（可能是空数据），给一个极小值避免报错
     if het_other == 0: het_other = 0.000001
@@ -182,66 +307,36 @@ def process_vcf(args):
     print(f"   - 过滤距离阈值     : {thresh_other} bp (P={args.p_value}, 下限={args.min_threshold}bp)", file=sys.stderr)
     print(f"============================\n", file=sys.stderr)
 
-    # --- 步骤 3: 正式过滤 ---
-    buffer = []
-    kept_count = 0
-    removed_count = 0
+    # --- 步骤 3: 标记簇 ---
+    thresh_by_chrom = [thresh_sdr if chrom == args.sdr_chrom else thresh_other
+                       for chrom in chrom_codes]
+    
+    if HAVE_NUMBA:
+        keep, unsorted = mark_clusters(np.frombuffer(chrom_ids, dtype=np.int32),
+                             np.frombuffer(positions, dtype=np.int32),
+                             np.array(thresh_by_chrom, dtype=np.int64))
+    else:
+        # 纯 Python 下 array.array / list 的下标访问比 ndarray 快
+        keep, unsorted = mark_clusters(chrom_ids, positions, thresh_by_chrom)
     
+    if unsorted >= 0:
+        chrom = list(chrom_codes)[chrom_ids[unsorted]]
+        print(f"[ERROR] VCF 未按坐标排序：{chrom}:{positions[unsorted]} 出现在更大的位置之后。", file=sys.stderr)
+        print(f"[ERROR] 请先排序 (例如 bcftools sort) 后再运行。", file=sys.stderr)
+        sys.exit(1)
+    
+    valid_count = len(chrom_ids) - chrom_ids.count(-1)
+    kept_count = int(np.count_nonzero(keep))
+    removed_count = valid_count - kept_count
+    
+    # --- 步骤 4: 按标记输出 ---
+    # 按第一遍记录的字节偏移直接拷贝保留的行，不再逐行读取与判断
+    print(f"[Pass 2] 正在输出过滤结果...", file=sys.stderr)
+    ranges = kept_byte_ranges(offsets, keep, header_end)
     with open_vcf(args.input_vcf) as f:
-        for line in f:
-            if line.startswith("#"):
-                print(line, end='')
-                continue
-            
-            fields = line.split('\t')
-            try:
-                chrom = fields[0]
-                pos = int(fields[1])
-            except ValueError:
-                continue
-            
-            # 动态选择阈值
-            current_thresh = thresh_sdr if chrom == args.sdr_chrom else thresh_other
-            
-            current_var = {'line': line, 'chrom': chrom, 'pos': pos, 'keep': True}
-            new_buffer = []
-            
-            for prev_var in buffer:
-                if prev_var['chrom'] != chrom:
-                    if prev_var['keep']:
-                        print(prev_var['line'], end='')
-                        kept_count += 1
-                    else:
-                        removed_count += 1
-                    continue # 释放旧染色体 buffer
-
-                # 同染色体比较
-                dist = pos - prev_var['pos']
-                
-                if dist > current_thresh:
-                    # 安全
-                    if prev_var['keep']:
-                        print(prev_var['line'], end='')
-                        kept_count += 1
-                    else:
-                        removed_count += 1
-                else:
-                    # 冲突：连坐
-                    prev_var['keep'] = False
-                    current_var['keep'] = False
-                    new_buffer.append(prev_var)
-            
-            new_buffer.append(current_var)
-            buffer = new_buffer
-            
-    # 清空 buffer
-    for var in buffer:
-        if var['keep']:
-            print(var['line'], end='')
-            kept_count += 1
-        else:
-            removed_count += 1
-            
+        copy_byte_ranges(f, ranges, sys.stdout.buffer.write)
+    sys.stdout.flush()
+    
     print(f"[INFO] 过滤完成. 保留: {kept_count}, 移除: {removed_count}", file=sys.stderr)
 
 if __name__ == "__main__":
@@ -1,80 +1,283 @@
 #!/usr/bin/env python3
 import sys
+import os
 import gzip
+import mmap
+import array
+import shutil
+import tempfile
+import subprocess
+import contextlib
 import numpy as np
 
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """未安装 numba 时退化为普通 Python 函数"""
+        return lambda func: func
+
 if len(sys.argv) != 2:
     sys.stderr.write(f"Usage: {sys.argv[0]} <vcf_file>\n")
     sys.exit(1)
 
 vcf_file = sys.argv[1]
-dp_values = []
 
 def open_vcf(path):
+    # 以二进制方式读取，省去逐行 UTF-8 解码
     if path.endswith(".gz"):
-        return gzip.open(path, "rt")
+        return gzip.open(path, "rb")
     else:
-        return open(path, "r")
+        return open(path, "rb")
+
+def read_depths_text(path):
+    """纯 Python 逐行解析 (未安装 numba 时使用)"""
+    dp_raw = array.array("i")
+    dr_raw = array.array("i")
+    dv_raw = array.array("i")
+    last_fmt = None
+    dp_idx = dr_idx = dv_idx = -1
+
+    with open_vcf(path) as f:
+        for line in f:
+            if line.startswith(b"#"):
+                continue
+
+            # 只需要 FORMAT (第9列) 与第一个样本 (第10列)：限制切分次数，
+            # 不再对整行 rstrip，只清理样本列末尾的换行
+            fields = line.split(b"\t", 10)
+            if len(fields) < 10:
+                continue
+
+            # 同一 caller 输出的 FORMAT 通常整文件不变：只在 FORMAT 变化时重新解析各字段下标
+            fmt = fields[8]
+            if fmt != last_fmt:
+                last_fmt = fmt
+                # 一次遍历 FORMAT 同时定位 DP / DR / DV (重复出现时取第一个)
+                tag_idx = {}
+                for i, tag in enumerate(fmt.split(b":")):
+                    if tag in (b"DP", b"DR", b"DV"):
+                        tag_idx.setdefault(tag, i)
+                dp_idx = tag_idx.get(b"DP", -1)
+                if b"DR" in tag_idx and b"DV" in tag_idx:
+                    dr_idx = tag_idx[b"DR"]
+                    dv_idx = tag_idx[b"DV"]
+                else:
+                    dr_idx = dv_idx = -1
+
+            sample = fields[9].rstrip().split(b":")
+            n_sample = len(sample)
+
+            # 逐行只做字段提取，原始值先记下来；缺失 / "." / 非法值统一记为 -1，
+            # 策略选择与比例过滤在读完后向量化完成
+            dp = dr = dv = -1
+
+            # --- 策略 1 所需: 标准 DP (适用于 PBSV, SVIM) ---
+            if 0 <= dp_idx < n_sample:
+                val = sample[dp_idx]
+                if val.isdigit():
+                    dp = int(val)
+
+            # --- 策略 2 所需: cuteSV/Sniffles2 的 DR + DV ---
+            if 0 <= dr_idx < n_sample and dv_idx < n_sample:
+                val = sample[dr_idx]
+                if val.isdigit():
+                    dr = int(val)
+                val = sample[dv_idx]
+                if val.isdigit():
+                    dv = int(val)
+
+            dp_raw.append(dp)
+            dr_raw.append(dr)
+            dv_raw.append(dv)
+    return dp_raw, dr_raw, dv_raw
+
+# ==== 字节扫描公共部分 (BEGIN) ====
+# 本段与 VCF_dp_stats_v4.0.py 中的同名段落逐字一致：两个统计脚本各自独立运行、
+# 不共享模块，修改时需同步两处
+PIGZ = shutil.which("pigz")
+
+@contextlib.contextmanager
+def mapped_vcf(path):
+    """
+    以只读 mmap 映射 (解压后的) VCF 全文。普通文件直接映射；
+    .gz 先用 pigz (未安装时用 gzip 模块) 解压到匿名临时文件再映射。
+    """
+    with contextlib.ExitStack() as stack:
+        if path.endswith(".gz"):
+            f = stack.enter_context(tempfile.TemporaryFile())
+            if PIGZ:
+                ret = subprocess.run([PIGZ, "-dc", path], stdout=f).returncode
+                if ret != 0:
+                    sys.stderr.write(f"Error: pigz failed to decompress {path} (exit code {ret}).\n")
+                    sys.exit(1)
+            else:
+                with gzip.open(path, "rb") as gz:
+                    shutil.copyfileobj(gz, f, 1 << 20)
+            f.flush()
+        else:
+            f = stack.enter_context(open(path, "rb"))
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+@njit(cache=True)
+def format_sample_span(data, start, end):
+    """
+    行 [start, end) 中第 9 列 (FORMAT) 与第 10 列 (第一个样本，去掉末尾空白) 的起止下标；
+    列数不足时全部返回 -1
+    """
+    col = 0
+    col_start = start
+    fmt_s = -1
+    fmt_e = -1
+    for i in range(start, end + 1):
+        if i == end or data[i] == 9:
+            if col == 8:
+                fmt_s = col_start
+                fmt_e = i
+            elif col == 9:
+                smp_e = i
+                while smp_e > col_start and (data[smp_e - 1] == 32 or 9 <= data[smp_e - 1] <= 13):
+                    smp_e -= 1
+                return fmt_s, fmt_e, col_start, smp_e
+            col += 1
+            col_start = i + 1
+    return -1, -1, -1, -1
+
+@njit(cache=True)
+def int_field(data, start, end, k):
+    """样本列 [start, end) 中第 k 个冒号分隔字段的非负整数值；缺失 "."、越界或非纯数字返回 -1"""
+    j = 0
+    tok = start
+    for i in range(start, end + 1):
+        if i == end or data[i] == 58:
+            if j == k:
+                if i == tok:
+                    return -1
+                val = 0
+                for t in range(tok, i):
+                    d = np.int64(data[t]) - 48
+                    if d < 0 or d > 9:
+                        return -1
+                    val = val * 10 + d
+                return val
+            j += 1
+            tok = i + 1
+    return -1
+
+@njit(cache=True)
+def count_lines(data):
+    n = 1
+    for i in range(data.size):
+        if data[i] == 10:
+            n += 1
+    return n
+
+# ==== 字节扫描公共部分 (END) ====
+
+@njit(cache=True)
+def extract_depths(data):
+    """
+    逐字节扫描整个 VCF：跳过 "#" 行，定位 FORMAT 与第一个样本列，
+    一次遍历 FORMAT 得到 DP / DR / DV 的序号后直接解析样本中对应的整数 (缺失记为 -1)
+    """
+    max_records = count_lines(data)
+    dp_raw = np.empty(max_records, dtype=np.int32)
+    dr_raw = np.empty(max_records, dtype=np.int32)
+    dv_raw = np.empty(max_records, dtype=np.int32)
+    n = 0
+    start = 0
+    size = data.size
+    while start < size:
+        end = start
+        while end < size and data[end] != 10:
+            end += 1
+        if data[start] != 35:
+            fmt_s, fmt_e, smp_s, smp_e = format_sample_span(data, start, end)
+            if fmt_s >= 0:
+                # 一次遍历 FORMAT 同时定位 DP / DR / DV (重复出现时取第一个)
+                dp_idx = dr_idx = dv_idx = -1
+                j = 0
+                tok = fmt_s
+                for i in range(fmt_s, fmt_e + 1):
+                    if i == fmt_e or data[i] == 58:
+                        if i - tok == 2 and data[tok] == 68:
+                            c = data[tok + 1]
+                            if c == 80 and dp_idx < 0:
+                                dp_idx = j
+                            elif c == 82 and dr_idx < 0:
+                                dr_idx = j
+                            elif c == 86 and dv_idx < 0:
+                                dv_idx = j
+                        j += 1
+                        tok = i + 1
+
+                n_sample = 1
+                for i in range(smp_s, smp_e):
+                    if data[i] == 58:
+                        n_sample += 1
+
+                dp = dr = dv = -1
+                if dp_idx >= 0:
+                    dp = int_field(data, smp_s, smp_e, dp_idx)
+                if 0 <= dr_idx < n_sample and 0 <= dv_idx < n_sample:
+                    dr = int_field(data, smp_s, smp_e, dr_idx)
+                    dv = int_field(data, smp_s, smp_e, dv_idx)
+                dp_raw[n] = dp
+                dr_raw[n] = dr
+                dv_raw[n] = dv
+                n += 1
+        start = end + 1
+    return dp_raw[:n], dr_raw[:n], dv_raw[:n]
+
+def read_depths_numba(path):
+    """numba 编译的字节扫描解析，不为每条记录创建 Python 对象"""
+    with mapped_vcf(path) as mm:
+        return extract_depths(np.frombuffer(mm, dtype=np.uint8))
 
 print(f"Reading VCF file: {vcf_file} ...", file=sys.stderr)
+if HAVE_NUMBA:
+    dp_raw, dr_raw, dv_raw = read_depths_numba(vcf_file)
+else:
+    dp_raw, dr_raw, dv_raw = read_depths_text(vcf_file)
+
+dp_all = np.frombuffer(dp_raw, dtype=np.int32)
+dr_all = np.frombuffer(dr_raw, dtype=np.int32).astype(np.int64)
+dv_all = np.frombuffer(dv_raw, dtype=np.int32).astype(np.int64)
+
+# --- 策略 1: 优先使用 DP > 0 的记录 ---
+use_dp = dp_all > 0
+# --- 策略 2: 无有效 DP 时采用带“比例平衡”的 DR + DV 统计 ---
+# 引入 3 倍差值过滤逻辑 (针对 0/1 类型变异设计)：
+# 只有当两者都不为 0 且比例在 1/3 到 3 之间时才纳入统计 (排除纯合缺失或零深度行)
+# 如果你以后想统计 1/1 类型，可以放开对 dr=0 的限制
+balanced = (~use_dp & (dr_all > 0) & (dv_all > 0)
+            & (np.maximum(dr_all, dv_all) <= 3 * np.minimum(dr_all, dv_all)))
+
+dp = np.where(use_dp, dp_all, dr_all + dv_all)[use_dp | balanced]
 
-with open_vcf(vcf_file) as f:
-    for line in f:
-        if line.startswith("#"):
-            continue
-
-        fields = line.rstrip().split("\t")
-        if len(fields) < 10:
-            continue
-
-        fmt = fields[8].split(":")
-        sample = fields[9].split(":")
-        dp_found = False
-
-        # --- 策略 1: 优先读取标准 DP (适用于 PBSV, SVIM) ---
-        if "DP" in fmt:
-            try:
-                idx = fmt.index("DP")
-                val = sample[idx]
-                if val != "." and int(val) > 0:
-                    dp_values.append(int(val))
-                    dp_found = True
-            except: pass
-
-        # --- 策略 2: 针对 cuteSV/Sniffles2 采用带“比例平衡”的 DR + DV 统计 ---
-        if not dp_found and "DR" in fmt and "DV" in fmt:
-            try:
-                dr_idx = fmt.index("DR")
-                dv_idx = fmt.index("DV")
-                dr = int(sample[dr_idx]) if sample[dr_idx] != "." else 0
-                dv = int(sample[dv_idx]) if sample[dv_idx] != "." else 0
-                
-                # 排除纯合缺失或零深度行
-                if dr + dv > 0:
-                    # 引入 3 倍差值过滤逻辑 (针对 0/1 类型变异设计)
-                    # 只有当两者都不为 0 且比例在 1/3 到 3 之间时才纳入统计
-                    if dr > 0 and dv > 0:
-                        ratio = max(dr, dv) / min(dr, dv)
-                        if ratio <= 3.0:
-                            dp_values.append(dr + dv)
-                            dp_found = True
-                    # 如果你以后想统计 1/1 类型，可以放开对 dr=0 的限制
-            except: pass
-
-if len(dp_values) == 0:
+if dp.size == 0:
     sys.stderr.write("Error: No valid balanced depth/DP fields found.\n")
     sys.exit(1)
 
-dp = np.array(dp_values)
-median_dp = np.median(dp)
+# 只排序一次，中位数与最值直接按下标读取
+dp.sort()
+n = dp.size
+median_dp = (float(dp[(n - 1) // 2]) + float(dp[n // 2])) / 2
 mean_dp = np.mean(dp)
 
 print("\n==== SV Physical Depth Statistics v6.0 (Balanced-Mode) ====")
 print(f"Total variants used for stats: {dp.size}")
 print(f"Median Depth (P50)           : {median_dp:.2f}")
 print(f"Mean Depth                   : {mean_dp:.2f}")
-print(f"Min Value                    : {dp.min()}")
-print(f"Max Value                    : {dp.max()}")
+print(f"Min Value                    : {dp[0]}")
+print(f"Max Value                    : {dp[-1]}")
 print("-" * 55)
 print(f"Suggested minDP (0.5x Median): {max(5, int(median_dp * 0.5))}")
 print(f"Suggested maxDP (2.0x Median): {int(median_dp * 2.0)}")